@@ -5,16 +5,16 @@ Simple examples showing the single entry point usage
 
 import sys
 import os
-from grader import main
+from grader import main, make_grader
 
 
-def run_main_with_input(problem, code, student_id="student"):
+def run_main_with_input(problem, code, student_id="student", grader=None):
     """Helper function to run main function from grader.py with given problem and code"""
     try:
         print(f"--- Results for {student_id} ---")
 
         # Call main function directly with problem and code
-        success = main(problem, code, True)
+        success = main(problem, code, True, grader=grader)
 
         print("-" * 40)
         return success
@@ -25,7 +25,7 @@ def run_main_with_input(problem, code, student_id="student"):
         return False
 
 
-def example_1_basic_usage():
+def example_1_basic_usage(grader=None):
     """Example 1: Basic code grading"""
     print("=== EXAMPLE 1: Basic Usage ===")
 
@@ -33,10 +33,10 @@ def example_1_basic_usage():
     code = """def is_even(n):
   return n % 2 == 0"""
 
-    run_main_with_input(problem, code, "alice")
+    run_main_with_input(problem, code, "alice", grader=grader)
 
 
-def example_2_different_problems():
+def example_2_different_problems(grader=None):
     """Example 2: Different problems and solutions"""
     print("\n=== EXAMPLE 2: Different Problems ===")
 
@@ -62,10 +62,10 @@ def example_2_different_problems():
     ]
 
     for item in problems_and_solutions:
-        run_main_with_input(item["problem"], item["code"], item["student"])
+        run_main_with_input(item["problem"], item["code"], item["student"], grader=grader)
 
 
-def example_3_same_problem_different_solutions():
+def example_3_same_problem_different_solutions(grader=None):
     """Example 3: Same problem, different implementations"""
     print("\n=== EXAMPLE 3: Same Problem, Different Solutions ===")
 
@@ -102,10 +102,10 @@ def example_3_same_problem_different_solutions():
     ]
 
     for solution in solutions:
-        run_main_with_input(problem, solution["code"], solution["student"])
+        run_main_with_input(problem, solution["code"], solution["student"], grader=grader)
 
 
-def example_4_complex_problems():
+def example_4_complex_problems(grader=None):
     """Example 4: More complex programming problems"""
     print("\n=== EXAMPLE 4: Complex Problems ===")
 
@@ -167,10 +167,10 @@ def example_4_complex_problems():
     ]
 
     for item in complex_problems:
-        run_main_with_input(item["problem"], item["code"], item["student"])
+        run_main_with_input(item["problem"], item["code"], item["student"], grader=grader)
 
 
-def example_5_buggy_code():
+def example_5_buggy_code(grader=None):
     """Example 5: Code with bugs for testing"""
     print("\n=== EXAMPLE 5: Buggy Code Examples ===")
 
@@ -210,7 +210,7 @@ def example_5_buggy_code():
     ]
 
     for item in buggy_examples:
-        run_main_with_input(item["problem"], item["code"], item["student"])
+        run_main_with_input(item["problem"], item["code"], item["student"], grader=grader)
 
 
 if __name__ == "__main__":
@@ -226,11 +226,15 @@ if __name__ == "__main__":
     print("✅ grader.py found! Running examples...")
 
     try:
-        example_1_basic_usage()
-        example_2_different_problems()
-        example_3_same_problem_different_solutions()
-        example_4_complex_problems()
-        example_5_buggy_code()
+        # One shared grader for every example: a single connection test and
+        # one pooled HTTP session instead of a fresh client per submission
+        shared_grader = make_grader()
+
+        example_1_basic_usage(shared_grader)
+        example_2_different_problems(shared_grader)
+        example_3_same_problem_different_solutions(shared_grader)
+        example_4_complex_problems(shared_grader)
+        example_5_buggy_code(shared_grader)
 
         print("\n🎉 All examples completed!")
 
@@ -3,10 +3,16 @@ Code Grading System - Single Entry Point
 Simple, clean interface for grading student code using multiple AI providers
 """
 
-import json, os, dotenv
-from typing import Dict, Any, Optional, List
+import asyncio
+import dataclasses
+import hashlib
+import os, re, dotenv
+from typing import Callable, Dict, Any, Optional, List
 
-from src.engine.grading_engine import GradingEngine, GradingResult
+from src.engine.grading_engine import CODE_PLACEHOLDER, GradingEngine, GradingResult
+
+# Matches the grade as soon as it appears in a streamed (partial) JSON response
+_TOTAL_SCORE_RE = re.compile(r'"total_score"\s*:\s*(-?\d+(?:\.\d+)?)')
 
 
 class CodeGrader:
@@ -35,10 +41,14 @@ class CodeGrader:
         """
         self.engine = GradingEngine(api_key, model, provider)
         self.provider = provider
-        self._test_connection()
 
-    def _test_connection(self):
-        """Test API connection on initialization"""
+    def test_connection(self):
+        """Probe the API with a round-trip test call.
+
+        Construction no longer does this automatically — a bad key or dead
+        network surfaces as a ConnectionError on the first real grading
+        call instead — so this is opt-in for callers who want to fail fast.
+        """
         if not self.engine.test_connection():
             raise ConnectionError(
                 f"Failed to connect to {self.provider} API. Please check your API key and internet connection."
@@ -51,6 +61,8 @@ class CodeGrader:
         student_id: str = "student",
         format: str = "json",
         model_solution: Optional[str] = None,
+        stream: bool = False,
+        on_partial: Optional[Callable[[str], None]] = None,
     ) -> Dict[str, Any]:
         """
         Grade a single code submission.
@@ -61,38 +73,226 @@ class CodeGrader:
             student_id: Optional student identifier
             format: Response format ("json", "simple", or "comprehensive")
             model_solution: Optional reference solution for comparison
+            stream: Stream the response so partial results arrive early
+            on_partial: Callback receiving the accumulated response text
+                after each streamed delta (only used when stream=True)
 
         Returns:
             Dictionary with grading results
         """
 
-        result = self.engine.grade_code(
-            student_id=student_id,
-            problem=problem,
-            code=student_code,
-            evaluation_type=format,
-            model_solution=model_solution,
-        )
+        if stream:
+            result = self.engine.grade_code_stream(
+                student_id=student_id,
+                problem=problem,
+                code=student_code,
+                evaluation_type=format,
+                model_solution=model_solution,
+                on_partial=on_partial,
+            )
+        else:
+            result = self.engine.grade_code(
+                student_id=student_id,
+                problem=problem,
+                code=student_code,
+                evaluation_type=format,
+                model_solution=model_solution,
+            )
 
         return self._format_result(result)
 
     def grade_multiple(
-        self, submissions: List[Dict[str, str]], format: str = "json"
+        self,
+        submissions: List[Dict[str, str]],
+        format: str = "json",
+        mode: str = "concurrent",
+        group_size: int = 8,
+        max_wait: float = 3600.0,
     ) -> List[Dict[str, Any]]:
         """
         Grade multiple code submissions.
 
+        The grading workload is network-bound (LLM API latency), so the
+        default "concurrent" mode dispatches all submissions concurrently:
+        wall-clock time is roughly max(latency) instead of sum(latencies).
+
+        "grouped" mode instead packs up to group_size submissions sharing
+        the same problem into a single multi-student prompt, so the rubric
+        and problem prefix are sent (and billed) once per chunk instead of
+        once per student. Only supported for the "json" format.
+
+        "batch" mode submits everything to the provider's asynchronous
+        batch endpoint (OpenAI/Anthropic only) — ~50% cheaper and not
+        subject to the synchronous rate limit, for bulk runs where waiting
+        is fine. Falls back to concurrent grading if the batch has not
+        finished within max_wait seconds.
+
         Args:
             submissions: List of dictionaries with 'problem', 'code', and optional 'student_id'
             format: Response format ("json", "simple", or "comprehensive")
+            mode: Dispatch strategy ("concurrent", "grouped", or "batch")
+            group_size: Submissions per prompt in "grouped" mode
+            max_wait: Seconds to wait for a "batch" mode job before falling
+                back to concurrent grading
 
         Returns:
             List of grading results
         """
 
-        results = self.engine.grade_batch(submissions, format)
+        if mode == "grouped" and format == "json":
+            return self._grade_multiple_grouped(submissions, group_size)
+        if mode == "batch":
+            return self._grade_multiple_batch(submissions, format, max_wait)
+
+        return asyncio.run(self.grade_multiple_async(submissions, format))
+
+    def _grade_multiple_batch(
+        self,
+        submissions: List[Dict[str, str]],
+        format: str,
+        max_wait: float,
+        poll_interval: float = 30.0,
+    ) -> List[Dict[str, Any]]:
+        """Grade via the provider's asynchronous batch endpoint"""
+
+        results = self.engine.grade_batch_offline(
+            submissions, format, max_wait, poll_interval
+        )
+        return [self._format_result(result) for result in results]
+
+    def _grade_multiple_grouped(
+        self, submissions: List[Dict[str, str]], group_size: int
+    ) -> List[Dict[str, Any]]:
+        """Grade submissions in multi-student prompt chunks"""
+
+        groups: Dict[Any, List[int]] = {}
+        for index, submission in enumerate(submissions):
+            key = (submission["problem"], submission.get("model_solution"))
+            groups.setdefault(key, []).append(index)
+
+        results: List[Any] = [None] * len(submissions)
+        for (problem, model_solution), indices in groups.items():
+            for start in range(0, len(indices), group_size):
+                chunk = indices[start : start + group_size]
+                chunk_results = self.engine.grade_group(
+                    problem,
+                    [submissions[i] for i in chunk],
+                    model_solution,
+                )
+                for i, result in zip(chunk, chunk_results):
+                    results[i] = result
+
+        return [self._format_result(result) for result in results]
+
+    async def grade_multiple_async(
+        self,
+        submissions: List[Dict[str, str]],
+        format: str = "json",
+        max_concurrency: int = 16,
+    ) -> List[Dict[str, Any]]:
+        """
+        Async version of grade_multiple.
+
+        All submissions are fired concurrently via asyncio.gather, capped by a
+        semaphore so large batches don't trip provider rate limits (429s).
+
+        Args:
+            submissions: List of dictionaries with 'problem', 'code', and optional 'student_id'
+            format: Response format ("json", "simple", or "comprehensive")
+            max_concurrency: Maximum number of in-flight API requests
+
+        Returns:
+            List of grading results in the same order as the input
+        """
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Classroom batches often contain identical template answers;
+        # grade each distinct (problem, code, model_solution) once and fan
+        # the result back out per student afterwards.
+        duplicate_of: Dict[int, int] = {}
+        first_seen: Dict[bytes, int] = {}
+        for index, submission in enumerate(submissions):
+            digest = hashlib.blake2b(
+                "\x00".join(
+                    (
+                        submission["problem"],
+                        submission["code"],
+                        submission.get("model_solution") or "",
+                    )
+                ).encode()
+            ).digest()
+            if digest in first_seen:
+                duplicate_of[index] = first_seen[digest]
+            else:
+                first_seen[digest] = index
+
+        # Build the prompt template once per (problem, model_solution) group
+        # and splice each student's code in, instead of regenerating the full
+        # rubric prompt per submission. Grouping also dispatches same-prefix
+        # requests consecutively, maximizing provider prefix-cache hits.
+        groups: Dict[Any, List[int]] = {}
+        for index, submission in enumerate(submissions):
+            if index in duplicate_of:
+                continue
+            key = (submission["problem"], submission.get("model_solution"))
+            groups.setdefault(key, []).append(index)
+
+        tasks = []
+        for (problem, model_solution), indices in groups.items():
+            if format == "json":
+                # Frozen-template renderer: prefix/suffix are built once per
+                # problem and each code is spliced in without a placeholder
+                # scan over the multi-KB template
+                render = self.engine.prompt_generator.bind_json(
+                    problem, model_solution
+                )
+            else:
+                template = self.engine.build_prompt_template(
+                    problem, format, model_solution
+                )
+                render = lambda code, t=template: t.replace(CODE_PLACEHOLDER, code)
+            for index in indices:
+                prompt = render(submissions[index]["code"])
+                tasks.append(
+                    self._grade_one_async(index, prompt, submissions[index], format, semaphore)
+                )
+
+        results: List[Any] = [None] * len(submissions)
+        try:
+            for index, result in await asyncio.gather(*tasks):
+                results[index] = result
+        finally:
+            await self.engine.client.aclose()
+
+        for index, canonical in duplicate_of.items():
+            results[index] = dataclasses.replace(
+                results[canonical],
+                student_id=submissions[index].get("student_id", "unknown"),
+            )
+
         return [self._format_result(result) for result in results]
 
+    async def _grade_one_async(
+        self,
+        index: int,
+        prompt: str,
+        submission: Dict[str, str],
+        format: str,
+        semaphore: asyncio.Semaphore,
+    ):
+        """Grade a single prebuilt prompt under the concurrency semaphore"""
+
+        async with semaphore:
+            result = await self.engine.grade_prebuilt_async(
+                prompt=prompt,
+                student_id=submission.get("student_id", "unknown"),
+                problem=submission["problem"],
+                code=submission["code"],
+                evaluation_type=format,
+            )
+        return index, result
+
     def _format_result(self, result: GradingResult) -> Dict[str, Any]:
         """Format result for external use"""
 
@@ -202,16 +402,36 @@ def get_prompt(problem: str, code: str, format: str = "json") -> str:
         return generator.generate_json_prompt(problem, code)
 
 
-def main(problem: str = None, student_code: str = None, detailed: bool = False):
+def make_grader() -> Optional[CodeGrader]:
+    """
+    Build a CodeGrader from the API_KEY environment variable.
+
+    Returns None when no key is configured. Callers grading many
+    submissions should build one grader and reuse it (see example.py), so
+    the HTTP connection pool and connection test are shared across calls.
+    """
+    dotenv.load_dotenv()
+    api_key = os.getenv("API_KEY", "YOUR_API_KEY_HERE")
+    if api_key == "YOUR_API_KEY_HERE":
+        return None
+
+    # TODO: ADJUST THIS TO YOUR PREFERRED MODEL
+    return CodeGrader(api_key, model="gemini-2.5-pro", provider="gemini")
+
+
+def main(
+    problem: str = None,
+    student_code: str = None,
+    detailed: bool = False,
+    grader: Optional[CodeGrader] = None,
+):
     print("🎓 Code Grading System")
     print("=" * 50)
 
-    # You need to set your Gemini API key here
-    # Load environment variables from .env file
-    dotenv.load_dotenv()
-    API_KEY = os.getenv("API_KEY", "YOUR_API_KEY_HERE")
+    if grader is None and os.getenv("API_KEY") is None:
+        dotenv.load_dotenv()
 
-    if API_KEY == "YOUR_API_KEY_HERE":
+    if grader is None and os.getenv("API_KEY", "YOUR_API_KEY_HERE") == "YOUR_API_KEY_HERE":
         print("❌ Please set your Gemini API key in the code")
         print("Get one free at: https://makersuite.google.com/app/apikey")
 
@@ -224,8 +444,21 @@ def main(problem: str = None, student_code: str = None, detailed: bool = False):
 
     else:
         try:
-            # TODO: ADJUST THIS TO YOUR PREFERRED MODEL
-            grader = CodeGrader(API_KEY, model="gemini-2.5-pro", provider="gemini")
+            if grader is None:
+                grader = make_grader()
+
+            # Stream the response so the grade can be shown as soon as it
+            # arrives, instead of waiting for the full feedback JSON
+            grade_shown = False
+
+            def show_grade_early(partial_text: str):
+                nonlocal grade_shown
+                if grade_shown:
+                    return
+                match = _TOTAL_SCORE_RE.search(partial_text)
+                if match:
+                    grade_shown = True
+                    print(f"⏱️ Grade (streamed): {match.group(1)}/100")
 
             result = grader.grade_code(
                 problem=problem
@@ -242,6 +475,8 @@ def find_max(numbers):
     return max_val
 """,
                 format="json",
+                stream=True,
+                on_partial=show_grade_early,
             )
 
             print("✅ Grading successful!")
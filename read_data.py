@@ -1,31 +1,93 @@
+"""
+Dataset loading helpers for the Moodle xlsx exports.
+
+Reads are column-pruned (usecols) and cached as Parquet next to the
+source file, so each export is parsed from xlsx at most once per change
+and repeat runs load only the columns they ask for.
+"""
+
+import hashlib
+import os
+from typing import List, Optional, Union
+
 import pandas as pd
+import pyarrow.parquet as pq
 
+# Columns actually consumed downstream; pruning the read to these avoids
+# materializing every other column of the (wide) Moodle exports
+ANSWER_COLUMNS = ["Surname", "First name", "Email address", "Response 6"]
+GRADE_COLUMNS = ["Surname", "First name", "Email address", "Q. 6 /4.00"]
 
-def read_xlsx_to_dataframe(path: str) -> pd.DataFrame:
+
+def read_xlsx_to_dataframe(path: str, usecols: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Reads all sheets from an Excel file and returns them
     as a single pandas DataFrame (merged).
+
+    Pass usecols to only decode the listed columns; openpyxl then streams
+    the sheets without constructing cells for the unused columns.
+
+    The merged frame is cached next to the xlsx as Parquet, so repeated
+    runs skip the slow xlsx parse and load the columnar cache instead.
+    The cache is rebuilt automatically whenever the xlsx is newer.
     """
-    all_sheets = pd.read_excel(path, sheet_name=None)
+    cache_path = _parquet_cache_path(path, usecols)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(
+        path
+    ):
+        return pd.read_parquet(cache_path, engine="pyarrow")
+
+    all_sheets = pd.read_excel(
+        path, sheet_name=None, usecols=usecols, engine="openpyxl"
+    )
 
     df = pd.concat(all_sheets.values(), ignore_index=True)
+
+    try:
+        df.to_parquet(cache_path, engine="pyarrow", compression="zstd")
+    except (OSError, ValueError):
+        pass  # cache is best-effort; a read-only dataset dir is fine
+
     return df
 
 
-def get_question_six_answers(df: pd.DataFrame) -> pd.DataFrame:
-    return df[["Surname", "First name", "Email address", "Response 6"]]
+def _parquet_cache_path(path: str, usecols: Optional[List[str]]) -> str:
+    """Cache file path for an xlsx read; distinct per column selection"""
+    if usecols:
+        tag = hashlib.blake2b("|".join(usecols).encode(), digest_size=6).hexdigest()
+        return f"{path}.{tag}.parquet"
+    return f"{path}.parquet"
 
 
-def get_question_six_grades(df: pd.DataFrame) -> pd.DataFrame:
-    return df[["Surname", "First name", "Email address", "Q. 6 /4.00"]]
+def _read_columns(path: str, columns: List[str]) -> pd.DataFrame:
+    """Read just the given columns of an xlsx, straight from the Parquet cache.
 
+    With a warm cache this decodes only the requested columns via pyarrow
+    instead of materializing the whole frame; on a cold cache it falls back
+    to the xlsx read (which also populates the cache for next time).
+    """
+    cache_path = _parquet_cache_path(path, columns)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(
+        path
+    ):
+        return pq.read_table(cache_path, columns=columns).to_pandas()
+    return read_xlsx_to_dataframe(path, usecols=columns)[columns]
 
-if __name__ == "__main__":
-    file_path = "dataset/IF1210_01-Ujian Akhir Semester-responses.xlsx"
-    answers_df = read_xlsx_to_dataframe(file_path)
-    grades_df = read_xlsx_to_dataframe(
-        "dataset/IF1210_01-Ujian Akhir Semester-grades.xlsx"
-    )
 
-    print(get_question_six_answers(answers_df))
-    print(get_question_six_grades(grades_df))
+def get_question_six_answers(source: Union[str, pd.DataFrame]) -> pd.DataFrame:
+    """Question-6 answer columns, from a DataFrame or an xlsx path"""
+    if isinstance(source, str):
+        return _read_columns(source, ANSWER_COLUMNS)
+    return source[ANSWER_COLUMNS]
+
+
+def get_question_six_grades(source: Union[str, pd.DataFrame]) -> pd.DataFrame:
+    """Question-6 grade columns, from a DataFrame or an xlsx path"""
+    if isinstance(source, str):
+        return _read_columns(source, GRADE_COLUMNS)
+    return source[GRADE_COLUMNS]
+
+
+if __name__ == "__main__":
+    print(get_question_six_answers("dataset/IF1210_01-Ujian Akhir Semester-responses.xlsx"))
+    print(get_question_six_grades("dataset/IF1210_01-Ujian Akhir Semester-grades.xlsx"))
@@ -3,14 +3,57 @@ Code Grading Engine
 Main processing engine that coordinates prompt generation and API calls
 """
 
-import json
-from typing import Dict, Any, Optional, List
+import asyncio
+import dataclasses
+import operator
+import os
+import re
+import time
+from typing import Callable, Dict, Any, Iterator, Optional, List
 from dataclasses import dataclass
 
+import msgspec
+import orjson
+
 from .grading_client import MultiModelClient, GradingResponse
 from ..prompts.generator import PromptGenerator
 
 
+class GradingJSON(msgspec.Struct):
+    """Typed view of the JSON evaluation schema (see generate_json_prompt).
+
+    Decoding into this struct validates types and fills defaults in one
+    C-level pass, so the batch path gets schema checking for free instead
+    of silently defaulting malformed fields through .get chains.
+    """
+
+    total_score: float = 0.0
+    percentage: Optional[float] = None
+    issues: List[Dict[str, Any]] = []
+    recommendations: List[str] = []
+    strengths: List[str] = []
+
+
+# Decoder instances are reusable and hold the compiled schema
+_GRADING_DECODER = msgspec.json.Decoder(GradingJSON)
+
+# Placeholder spliced into memoized prompt templates where the student
+# code goes (see GradingEngine.build_prompt_template)
+CODE_PLACEHOLDER = "<<CODE>>"
+
+# Score pattern for comprehensive (free-text) responses, compiled once at
+# import. One case-insensitive alternation scans the text a single time
+# instead of one pass per label variant.
+_SCORE_RE = re.compile(r"(?:TOTAL|Total|Score|Grade):\s*(\d+)/100", re.IGNORECASE)
+_PCT_PATTERN = re.compile(r"(\d+\.?\d*)%")
+
+# Pulls all result fields from a parsed evaluation in one C-level pass;
+# responses that follow the prompt schema skip the per-field .get chain
+_RESULT_FIELDS = operator.itemgetter(
+    "total_score", "percentage", "issues", "recommendations", "strengths"
+)
+
+
 @dataclass
 class GradingResult:
     """Complete grading result"""
@@ -33,10 +76,30 @@ class GradingEngine:
     """Main engine for code evaluation"""
 
     def __init__(
-        self, api_key: str, model: str = "gpt-3.5-turbo", provider: str = "openai"
+        self,
+        api_key: str,
+        model: str = "gpt-3.5-turbo",
+        provider: str = "openai",
+        max_workers: int = 8,
+        keep_raw: bool = False,
     ):
         self.client = MultiModelClient(api_key, model, provider)
         self.prompt_generator = PromptGenerator()
+        self.max_workers = max_workers
+        # The raw LLM text is several KB per submission; once it has been
+        # parsed into structured feedback there is no reason to retain it
+        # for the lifetime of a batch unless a caller opts in
+        self.keep_raw = keep_raw
+
+    def close(self):
+        """Close the client's pooled HTTP connections"""
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def grade_code(
         self,
@@ -49,23 +112,164 @@ class GradingEngine:
         """Grade a single code submission"""
 
         # Generate appropriate prompt
-        if evaluation_type == "json":
-            prompt = self.prompt_generator.generate_json_prompt(
-                problem, code, model_solution
+        prompt = self._build_prompt(problem, code, evaluation_type, model_solution)
+
+        # Get response from Gemini
+        response = self.client.evaluate_code(
+            prompt, max_tokens=self.client.max_tokens_for_format(evaluation_type)
+        )
+
+        return self._parse_result(student_id, problem, code, evaluation_type, response)
+
+    def grade_code_stream(
+        self,
+        student_id: str,
+        problem: str,
+        code: str,
+        evaluation_type: str = "json",
+        model_solution: Optional[str] = None,
+        on_partial: Optional[Callable[[str], None]] = None,
+    ) -> GradingResult:
+        """Grade a submission over the provider's streaming endpoint.
+
+        The final GradingResult is identical to grade_code, but on_partial
+        (if given) is invoked with the accumulated response text after each
+        delta, so callers can show the grade as soon as it arrives instead
+        of waiting for the full feedback JSON.
+        """
+
+        prompt = self._build_prompt(problem, code, evaluation_type, model_solution)
+        start_time = time.time()
+        accumulated = ""
+
+        try:
+            for delta in self.client.evaluate_code(
+                prompt,
+                stream=True,
+                max_tokens=self.client.max_tokens_for_format(evaluation_type),
+                # json/simple responses are a single JSON value, so the
+                # stream can be dropped once it closes
+                stop_after_json=evaluation_type in ("json", "simple"),
+            ):
+                accumulated += delta
+                if on_partial:
+                    on_partial(accumulated)
+            response = GradingResponse(
+                success=True,
+                raw_response=accumulated,
+                processing_time=time.time() - start_time,
             )
-        elif evaluation_type == "simple":
-            prompt = self.prompt_generator.generate_simple_prompt(problem, code)
+        except Exception as e:
+            response = GradingResponse(
+                success=False,
+                error_message=f"Error streaming from {self.client.provider} API: {str(e)}",
+                processing_time=time.time() - start_time,
+            )
+
+        return self._parse_result(student_id, problem, code, evaluation_type, response)
+
+    async def grade_code_async(
+        self,
+        student_id: str,
+        problem: str,
+        code: str,
+        evaluation_type: str = "json",
+        model_solution: Optional[str] = None,
+        compact: bool = False,
+    ) -> GradingResult:
+        """Async version of grade_code for concurrent batch grading"""
+
+        prompt = self._build_prompt(problem, code, evaluation_type, model_solution)
+        response = await self.client.aevaluate_code(
+            prompt, max_tokens=self.client.max_tokens_for_format(evaluation_type)
+        )
+
+        return self._parse_result(
+            student_id, problem, code, evaluation_type, response, compact
+        )
+
+    def build_prompt_template(
+        self,
+        problem: str,
+        evaluation_type: str = "json",
+        model_solution: Optional[str] = None,
+    ) -> str:
+        """Build a reusable prompt with CODE_PLACEHOLDER where the code goes.
+
+        When many submissions share the same problem, the template is built
+        once and each student's code spliced in, instead of regenerating the
+        full rubric prompt per submission. Keeping the shared prefix
+        byte-identical also lets providers apply their prefix caching.
+        """
+        return self._build_prompt(
+            problem, CODE_PLACEHOLDER, evaluation_type, model_solution
+        )
+
+    def grade_prebuilt(
+        self,
+        prompt: str,
+        student_id: str,
+        problem: str,
+        code: str,
+        evaluation_type: str = "json",
+    ) -> GradingResult:
+        """Grade with an already-built prompt, skipping the generator"""
+
+        response = self.client.evaluate_code(
+            prompt, max_tokens=self.client.max_tokens_for_format(evaluation_type)
+        )
+        return self._parse_result(student_id, problem, code, evaluation_type, response)
+
+    async def grade_prebuilt_async(
+        self,
+        prompt: str,
+        student_id: str,
+        problem: str,
+        code: str,
+        evaluation_type: str = "json",
+    ) -> GradingResult:
+        """Async variant of grade_prebuilt"""
+
+        response = await self.client.aevaluate_code(
+            prompt, max_tokens=self.client.max_tokens_for_format(evaluation_type)
+        )
+        return self._parse_result(student_id, problem, code, evaluation_type, response)
+
+    def _build_prompt(
+        self,
+        problem: str,
+        code: str,
+        evaluation_type: str,
+        model_solution: Optional[str] = None,
+    ) -> str:
+        """Generate the prompt for the requested evaluation type"""
+
+        if evaluation_type == "simple":
+            return self.prompt_generator.generate_simple_prompt(problem, code)
         elif evaluation_type == "comprehensive":
-            prompt = self.prompt_generator.generate_comprehensive_prompt(
+            return self.prompt_generator.generate_comprehensive_prompt(
                 problem, code, model_solution
             )
         else:
-            prompt = self.prompt_generator.generate_json_prompt(
+            return self.prompt_generator.generate_json_prompt(
                 problem, code, model_solution
             )
 
-        # Get response from Gemini
-        response = self.client.evaluate_code(prompt)
+    def _parse_result(
+        self,
+        student_id: str,
+        problem: str,
+        code: str,
+        evaluation_type: str,
+        response: GradingResponse,
+        compact: bool = False,
+    ) -> GradingResult:
+        """Turn a raw GradingResponse into a GradingResult.
+
+        compact drops the full feedback dict from json results, keeping
+        only the dedicated issues/recommendations/strengths fields — see
+        _parse_json_result.
+        """
 
         if not response.success:
             return GradingResult(
@@ -79,16 +283,31 @@ class GradingEngine:
 
         # Parse response based on evaluation type
         if evaluation_type == "json":
-            return self._parse_json_result(student_id, problem, code, response)
+            return self._parse_json_result(student_id, problem, code, response, compact)
         elif evaluation_type == "simple":
             return self._parse_simple_result(student_id, problem, code, response)
         else:
             return self._parse_text_result(student_id, problem, code, response)
 
     def _parse_json_result(
-        self, student_id: str, problem: str, code: str, response: GradingResponse
+        self,
+        student_id: str,
+        problem: str,
+        code: str,
+        response: GradingResponse,
+        compact: bool = False,
     ) -> GradingResult:
-        """Parse JSON format response"""
+        """Parse JSON format response.
+
+        With compact=True the result keeps only the dedicated
+        issues/recommendations/strengths lists and drops the full parsed
+        dict (feedback=None), which would otherwise duplicate them plus
+        the per-category feedback text for every submission in a batch.
+        Callers that read feedback["category_scores"] need the default.
+        """
+
+        if compact:
+            return self._parse_json_result_typed(student_id, problem, code, response)
 
         parsed = self.client.parse_json_response(response.raw_response)
 
@@ -102,12 +321,82 @@ class GradingEngine:
                 error_message=f"JSON parsing error: {parsed['error']}",
             )
 
-        # Extract information from JSON response
-        grade = parsed.get("total_score", 0)
-        percentage = parsed.get("percentage", (grade / 100.0 * 100) if grade else 0)
-        issues = parsed.get("issues", [])
-        recommendations = parsed.get("recommendations", [])
-        strengths = parsed.get("strengths", [])
+        if not self.keep_raw:
+            response.raw_response = ""
+
+        return self._result_from_parsed(
+            student_id, problem, code, parsed, response.processing_time, compact
+        )
+
+    def _parse_json_result_typed(
+        self, student_id: str, problem: str, code: str, response: GradingResponse
+    ) -> GradingResult:
+        """Decode a JSON response straight into the GradingJSON struct.
+
+        One typed msgspec pass replaces orjson.loads plus the per-field
+        extraction, and a response whose fields have the wrong types fails
+        loudly here instead of poisoning batch statistics downstream.
+        """
+
+        try:
+            obj = _GRADING_DECODER.decode(
+                self.client.extract_json(response.raw_response)
+            )
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            return GradingResult(
+                student_id=student_id,
+                problem=problem,
+                code=code,
+                success=False,
+                processing_time=response.processing_time,
+                error_message=f"JSON parsing error: {e}",
+            )
+
+        if not self.keep_raw:
+            response.raw_response = ""
+
+        percentage = obj.percentage
+        if percentage is None:
+            percentage = obj.total_score
+
+        return GradingResult(
+            student_id=student_id,
+            problem=problem,
+            code=code,
+            success=True,
+            grade=obj.total_score,
+            percentage=percentage,
+            issues=obj.issues,
+            recommendations=obj.recommendations,
+            strengths=obj.strengths,
+            processing_time=response.processing_time,
+        )
+
+    def _result_from_parsed(
+        self,
+        student_id: str,
+        problem: str,
+        code: str,
+        parsed: Dict[str, Any],
+        processing_time: float,
+        compact: bool = False,
+    ) -> GradingResult:
+        """Build a GradingResult from an already-parsed JSON evaluation"""
+
+        try:
+            grade, percentage, issues, recommendations, strengths = _RESULT_FIELDS(
+                parsed
+            )
+        except KeyError:
+            # Response strayed from the schema; fall back to per-field defaults
+            grade = parsed.get("total_score", 0)
+            # Scores are out of 100, so the grade doubles as the percentage
+            percentage = parsed.get("percentage")
+            if percentage is None:
+                percentage = float(grade) if grade else 0.0
+            issues = parsed.get("issues", [])
+            recommendations = parsed.get("recommendations", [])
+            strengths = parsed.get("strengths", [])
 
         return GradingResult(
             student_id=student_id,
@@ -116,11 +405,11 @@ class GradingEngine:
             success=True,
             grade=grade,
             percentage=percentage,
-            feedback=parsed,
+            feedback=None if compact else parsed,
             issues=issues,
             recommendations=recommendations,
             strengths=strengths,
-            processing_time=response.processing_time,
+            processing_time=processing_time,
         )
 
     def _parse_simple_result(
@@ -140,6 +429,9 @@ class GradingEngine:
                 error_message=f"JSON parsing error: {parsed['error']}",
             )
 
+        if not self.keep_raw:
+            response.raw_response = ""
+
         is_correct = parsed.get("is_correct", False)
         hints = parsed.get("hints", [])
 
@@ -167,25 +459,14 @@ class GradingEngine:
         text = response.raw_response
         grade = None
 
-        # Look for score patterns
-        import re
-
-        score_patterns = [
-            r"TOTAL:\s*(\d+)/100",
-            r"Total:\s*(\d+)/100",
-            r"Score:\s*(\d+)/100",
-            r"Grade:\s*(\d+)/100",
-        ]
-
-        for pattern in score_patterns:
-            match = re.search(pattern, text)
-            if match:
-                grade = float(match.group(1))
-                break
+        # Look for a score label in a single scan
+        match = _SCORE_RE.search(text)
+        if match:
+            grade = float(match.group(1))
 
         # Look for percentage if no grade found
         if grade is None:
-            percentage_match = re.search(r"(\d+\.?\d*)%", text)
+            percentage_match = _PCT_PATTERN.search(text)
             if percentage_match:
                 grade = float(percentage_match.group(1))
 
@@ -202,25 +483,334 @@ class GradingEngine:
             processing_time=response.processing_time,
         )
 
+    def grade_group(
+        self,
+        problem: str,
+        submissions: List[Dict[str, Any]],
+        model_solution: Optional[str] = None,
+    ) -> List[GradingResult]:
+        """Grade several submissions of the same problem in one API call.
+
+        The rubric/problem prefix is sent once for the whole group instead
+        of once per student. The model returns a JSON array, one element per
+        submission; any submission the model fails to grade (missing or
+        malformed array element) is re-graded individually.
+        """
+
+        codes = [submission["code"] for submission in submissions]
+        prompt = self.prompt_generator.generate_group_prompt(
+            problem, codes, model_solution
+        )
+        response = self.client.evaluate_code(prompt)
+
+        entries: List[Any] = []
+        if response.success:
+            parsed = self.client.parse_json_response(response.raw_response)
+            if isinstance(parsed, list):
+                entries = parsed
+
+        results = []
+        for index, submission in enumerate(submissions):
+            student_id = submission.get("student_id", "unknown")
+            entry = entries[index] if index < len(entries) else None
+            if isinstance(entry, dict) and "total_score" in entry:
+                results.append(
+                    self._result_from_parsed(
+                        student_id,
+                        problem,
+                        submission["code"],
+                        entry,
+                        response.processing_time / len(submissions),
+                    )
+                )
+            else:
+                # Partial failure: fall back to grading this one individually
+                results.append(
+                    self.grade_code(
+                        student_id=student_id,
+                        problem=problem,
+                        code=submission["code"],
+                        evaluation_type="json",
+                        model_solution=model_solution,
+                    )
+                )
+
+        return results
+
+    def grade_batch_offline(
+        self,
+        submissions: List[Dict[str, Any]],
+        evaluation_type: str = "json",
+        max_wait: float = 3600.0,
+        poll_interval: float = 30.0,
+        compact: bool = False,
+    ) -> List[GradingResult]:
+        """Grade via the provider's asynchronous batch endpoint.
+
+        All prompts are uploaded as one batch job (OpenAI/Anthropic only;
+        ~50% cheaper, much higher throughput quota, 24h SLA) and polled
+        until done. custom_id is the submission index, not the student_id,
+        so duplicate or missing ids cannot collide. If the batch has not
+        finished within max_wait seconds, falls back to concurrent grading.
+        compact applies to both branches, so results have the same shape
+        whether or not the batch finished in time; it defaults to False
+        because CodeGrader's batch mode surfaces the feedback dict.
+        """
+
+        prompts = {
+            str(index): self._build_prompt(
+                submission["problem"],
+                submission["code"],
+                evaluation_type,
+                submission.get("model_solution"),
+            )
+            for index, submission in enumerate(submissions)
+        }
+        batch_id = self.client.submit_batch(prompts)
+
+        deadline = time.time() + max_wait
+        responses = None
+        while time.time() < deadline:
+            responses = self.client.poll_batch(batch_id)
+            if responses is not None:
+                break
+            time.sleep(min(poll_interval, max(deadline - time.time(), 0)))
+
+        if responses is None:
+            # Batch not done in time; grade synchronously instead
+            return self.grade_batch(submissions, evaluation_type, compact=compact)
+
+        results = []
+        for index, submission in enumerate(submissions):
+            raw = responses.get(str(index))
+            results.append(
+                self._parse_result(
+                    student_id=submission.get("student_id", "unknown"),
+                    problem=submission["problem"],
+                    code=submission["code"],
+                    evaluation_type=evaluation_type,
+                    response=GradingResponse(
+                        success=raw is not None,
+                        raw_response=raw or "",
+                        error_message=(
+                            None if raw is not None else "missing from batch output"
+                        ),
+                    ),
+                    compact=compact,
+                )
+            )
+        return results
+
+    @staticmethod
+    def results_to_frame(results: List[GradingResult]):
+        """Convert GradingResults to a struct-of-arrays pandas DataFrame.
+
+        The numeric columns come out as contiguous float32/bool arrays, so
+        class-level statistics (mean, std, percentiles, grade curves) run
+        as vectorized NumPy ops instead of attribute access over a list of
+        dataclasses. pandas/numpy are imported here so the grading path
+        itself doesn't pay for them.
+        """
+        import numpy as np
+        import pandas as pd
+
+        count = len(results)
+        return pd.DataFrame(
+            {
+                "student_id": [result.student_id for result in results],
+                "success": np.fromiter(
+                    (result.success for result in results), dtype=bool, count=count
+                ),
+                "grade": np.fromiter(
+                    (
+                        np.nan if result.grade is None else result.grade
+                        for result in results
+                    ),
+                    dtype=np.float32,
+                    count=count,
+                ),
+                "percentage": np.fromiter(
+                    (
+                        np.nan if result.percentage is None else result.percentage
+                        for result in results
+                    ),
+                    dtype=np.float32,
+                    count=count,
+                ),
+                "processing_time": np.fromiter(
+                    (result.processing_time for result in results),
+                    dtype=np.float32,
+                    count=count,
+                ),
+            }
+        )
+
     def test_connection(self) -> bool:
         """Test the Gemini API connection"""
         result = self.client.test_connection()
         return result.success
 
+    def _concurrency(self, concurrency: Optional[int]) -> int:
+        """In-flight request cap for batch grading.
+
+        Explicit argument wins, then the GRADER_CONCURRENCY environment
+        variable (so the cap can be matched to a provider tier's rate
+        limit without code changes), then max_workers.
+        """
+        if concurrency is not None:
+            return concurrency
+        env = os.getenv("GRADER_CONCURRENCY")
+        return int(env) if env else self.max_workers
+
     def grade_batch(
-        self, submissions: List[Dict[str, Any]], evaluation_type: str = "json"
+        self,
+        submissions: List[Dict[str, Any]],
+        evaluation_type: str = "json",
+        concurrency: Optional[int] = None,
+        compact: bool = True,
     ) -> List[GradingResult]:
-        """Grade multiple submissions"""
+        """Grade multiple submissions concurrently (sync entry point).
 
-        results = []
-        for submission in submissions:
-            result = self.grade_code(
+        Thin asyncio.run wrapper around grade_batch_async for callers not
+        already inside an event loop.
+        """
+
+        return asyncio.run(
+            self.grade_batch_async(submissions, evaluation_type, concurrency, compact)
+        )
+
+    async def grade_batch_async(
+        self,
+        submissions: List[Dict[str, Any]],
+        evaluation_type: str = "json",
+        concurrency: Optional[int] = None,
+        compact: bool = True,
+    ) -> List[GradingResult]:
+        """Grade multiple submissions concurrently with asyncio.gather.
+
+        Each grading call is network-bound (LLM latency dominates), so all
+        submissions are fired at once on the shared async HTTP client,
+        capped by a semaphore (see _concurrency) so large batches don't
+        trip provider rate limits. Requests are dispatched grouped by
+        (problem, model_solution) so identical prompt prefixes hit the
+        provider consecutively and its prefix/KV cache can reuse them;
+        results still come back in submission order. compact=False keeps
+        the full feedback dict on each result (see _parse_json_result).
+        """
+
+        semaphore = asyncio.Semaphore(self._concurrency(concurrency))
+        order = self._prefix_sorted_order(submissions)
+        results: List[Optional[GradingResult]] = [None] * len(submissions)
+        try:
+            gathered = await asyncio.gather(
+                *[
+                    self._grade_one_async(
+                        submissions[i], evaluation_type, semaphore, compact
+                    )
+                    for i in order
+                ]
+            )
+            for index, result in zip(order, gathered):
+                results[index] = result
+            return results
+        finally:
+            await self.client.aclose()
+
+    @staticmethod
+    def _prefix_sorted_order(submissions: List[Dict[str, Any]]) -> List[int]:
+        """Submission indices sorted so identical prompt prefixes are adjacent"""
+        return sorted(
+            range(len(submissions)),
+            key=lambda i: (
+                submissions[i]["problem"],
+                submissions[i].get("model_solution") or "",
+            ),
+        )
+
+    async def grade_batch_as_completed(
+        self,
+        submissions: List[Dict[str, Any]],
+        evaluation_type: str = "json",
+        concurrency: Optional[int] = None,
+        compact: bool = True,
+    ):
+        """Yield GradingResults as they finish, in completion order.
+
+        Every submission is wrapped in asyncio.create_task immediately, so
+        the first requests are already in flight while later prompts are
+        still being built (prompt assembly happens inside each task), and
+        callers can start post-processing results while the slowest calls
+        are still outstanding. Use grade_batch_async when input order
+        matters.
+        """
+
+        semaphore = asyncio.Semaphore(self._concurrency(concurrency))
+        tasks = [
+            asyncio.create_task(
+                self._grade_one_async(
+                    submissions[i], evaluation_type, semaphore, compact
+                )
+            )
+            for i in self._prefix_sorted_order(submissions)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.client.aclose()
+
+    def grade_batch_stream(
+        self,
+        submissions: List[Dict[str, Any]],
+        out_path: str,
+        evaluation_type: str = "json",
+    ) -> Iterator[GradingResult]:
+        """Grade a batch, persisting each result to a JSONL file as it lands.
+
+        Results stream out lazily in completion order, so callers (and the
+        output file) see progress immediately and nothing requires holding
+        the whole batch of results in memory at once. The problem and code
+        fields are omitted from the file — they duplicate the caller's
+        input; records are keyed by student_id. The yielded GradingResults
+        are complete.
+        """
+
+        loop = asyncio.new_event_loop()
+        batch = self.grade_batch_as_completed(submissions, evaluation_type)
+        try:
+            with open(out_path, "wb") as f:
+                while True:
+                    try:
+                        result = loop.run_until_complete(batch.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    record = dataclasses.asdict(result)
+                    del record["problem"], record["code"]
+                    f.write(orjson.dumps(record) + b"\n")
+                    yield result
+        finally:
+            loop.run_until_complete(batch.aclose())
+            loop.close()
+
+    async def _grade_one_async(
+        self,
+        submission: Dict[str, Any],
+        evaluation_type: str,
+        semaphore: asyncio.Semaphore,
+        compact: bool = True,
+    ) -> GradingResult:
+        """Grade a single submission dict under the concurrency semaphore"""
+
+        async with semaphore:
+            # Batches default to compact results: the feedback dict would
+            # pin O(response size) per submission for the whole run
+            return await self.grade_code_async(
                 student_id=submission.get("student_id", "unknown"),
                 problem=submission["problem"],
                 code=submission["code"],
                 evaluation_type=evaluation_type,
                 model_solution=submission.get("model_solution"),
+                compact=compact,
             )
-            results.append(result)
-
-        return results
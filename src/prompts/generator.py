@@ -3,7 +3,32 @@ Prompt Generation Module
 Clean separation of prompt engineering logic
 """
 
-from typing import Optional, Dict, Any
+import functools
+from typing import Callable, List, Optional, Dict, Any
+
+
+@functools.lru_cache(maxsize=256)
+def _json_template(
+    prefix: str, suffix: str, problem: str, model_solution: Optional[str]
+) -> tuple:
+    """(head, tail) of the JSON prompt for one problem, memoized.
+
+    Batch runs grade many students against the same problem; caching on
+    the argument strings makes every repeat a dict lookup instead of
+    re-interpolating the multi-KB fixed sections.
+    """
+
+    model_section = ""
+    if model_solution:
+        model_section = f"""
+## REFERENCE SOLUTION:
+```
+{model_solution}
+```
+"""
+
+    head = f"{prefix}{problem}\n{model_section}\n## STUDENT CODE:\n```\n"
+    return head, suffix
 
 
 class PromptGenerator:
@@ -12,6 +37,18 @@ class PromptGenerator:
     def __init__(self):
         self.system_prompt = self._get_system_prompt()
         self.metrics = self._get_metrics()
+        # The fixed sections around the problem/code are assembled once
+        # here; the generate_* hot paths then only interpolate the three
+        # variable pieces instead of rebuilding the multi-KB preamble and
+        # schema per submission
+        self._json_prefix = f"{self.system_prompt}\n\n## PROBLEM:\n"
+        self._json_suffix = (
+            f"\n```\n\n{self.metrics}\n\n{self._get_json_output_section()}"
+        )
+        self._comprehensive_prefix = f"{self.system_prompt}\n\n## PROBLEM DESCRIPTION:\n"
+        self._comprehensive_suffix = (
+            f"\n```\n\n{self.metrics}\n\n{self._get_comprehensive_instructions()}"
+        )
 
     def _get_system_prompt(self) -> str:
         """System prompt for the LLM"""
@@ -63,11 +100,83 @@ TESTING (8 points):
 - Error Handling (2 pts): Validates inputs and handles errors
 """
 
+    def _get_json_output_section(self) -> str:
+        """Static output-format instructions for the JSON prompt"""
+        return """## REQUIRED OUTPUT:
+Respond with ONLY a valid JSON object in this exact format:
+
+```json
+{
+    "total_score": number,
+    "percentage": number,
+    "is_correct": boolean,
+    "category_scores": {
+        "correctness": {"score": number, "max": 40, "feedback": "string"},
+        "efficiency": {"score": number, "max": 27, "feedback": "string"},
+        "data_structures": {"score": number, "max": 15, "feedback": "string"},
+        "code_quality": {"score": number, "max": 10, "feedback": "string"},
+        "testing": {"score": number, "max": 8, "feedback": "string"}
+    },
+    "issues": [
+        {
+            "line_number": number,
+            "description": "string",
+            "severity": "critical|major|minor",
+            "suggestion": "string"
+        }
+    ],
+    "strengths": ["string"],
+    "recommendations": ["string"],
+    "complexity_analysis": {
+        "time_complexity": "string",
+        "space_complexity": "string"
+    }
+}
+```
+
+Evaluate the code now and respond with only the JSON object."""
+
     def generate_json_prompt(
         self, problem: str, student_code: str, model_solution: Optional[str] = None
     ) -> str:
         """Generate JSON format evaluation prompt"""
 
+        head, tail = _json_template(
+            self._json_prefix, self._json_suffix, problem, model_solution
+        )
+        return f"{head}{student_code}{tail}"
+
+    def bind_json(
+        self, problem: str, model_solution: Optional[str] = None
+    ) -> Callable[[str], str]:
+        """Specialize the JSON prompt for one problem, returning a renderer.
+
+        Everything except the student code is concatenated once up front;
+        the returned callable just splices a submission between the frozen
+        prefix and suffix. Output is identical to generate_json_prompt, but
+        grading a whole class of the same problem pays the template cost
+        once instead of per student.
+        """
+
+        head, tail = _json_template(
+            self._json_prefix, self._json_suffix, problem, model_solution
+        )
+        return lambda student_code: f"{head}{student_code}{tail}"
+
+    def generate_group_prompt(
+        self,
+        problem: str,
+        student_codes: List[str],
+        model_solution: Optional[str] = None,
+    ) -> str:
+        """Generate one prompt that grades several submissions at once.
+
+        Sending K submissions for the same problem in a single request
+        amortizes the system prompt, rubric and problem text that would
+        otherwise be repeated K times, cutting prefix tokens and requests
+        roughly K-fold.
+        """
+
         model_section = ""
         if model_solution:
             model_section = f"""
@@ -77,20 +186,24 @@ TESTING (8 points):
 ```
 """
 
+        submissions_section = "\n".join(
+            f"### SUBMISSION {i + 1}:\n```\n{code}\n```"
+            for i, code in enumerate(student_codes)
+        )
+
         return f"""{self.system_prompt}
 
 ## PROBLEM:
 {problem}
 {model_section}
-## STUDENT CODE:
-```
-{student_code}
-```
+## STUDENT SUBMISSIONS ({len(student_codes)} total):
+{submissions_section}
 
 {self.metrics}
 
 ## REQUIRED OUTPUT:
-Respond with ONLY a valid JSON object in this exact format:
+Respond with ONLY a valid JSON array of {len(student_codes)} objects, where
+element i grades SUBMISSION i+1. Each object must use this exact format:
 
 ```json
 {{
@@ -121,7 +234,7 @@ Respond with ONLY a valid JSON object in this exact format:
 }}
 ```
 
-Evaluate the code now and respond with only the JSON object."""
+Evaluate every submission independently and respond with only the JSON array."""
 
     def generate_simple_prompt(self, problem: str, student_code: str) -> str:
         """Generate simple teaching assistant style prompt"""
@@ -159,33 +272,9 @@ If the code is correct, return:
     "hints": []
 }}"""
 
-    def generate_comprehensive_prompt(
-        self, problem: str, student_code: str, model_solution: Optional[str] = None
-    ) -> str:
-        """Generate comprehensive text evaluation prompt"""
-
-        model_section = ""
-        if model_solution:
-            model_section = f"""
-## MODEL SOLUTION:
-```
-{model_solution}
-```
-"""
-
-        return f"""{self.system_prompt}
-
-## PROBLEM DESCRIPTION:
-{problem}
-{model_section}
-## STUDENT SUBMISSION:
-```
-{student_code}
-```
-
-{self.metrics}
-
-## EVALUATION INSTRUCTIONS:
+    def _get_comprehensive_instructions(self) -> str:
+        """Static evaluation instructions for the comprehensive prompt"""
+        return """## EVALUATION INSTRUCTIONS:
 Provide a comprehensive evaluation including:
 
 1. **FUNCTIONALITY ANALYSIS**
@@ -216,3 +305,22 @@ Provide a comprehensive evaluation including:
    - Top 3 strengths
    - Top 3 areas for improvement
    - Specific suggestions for enhancement"""
+
+    def generate_comprehensive_prompt(
+        self, problem: str, student_code: str, model_solution: Optional[str] = None
+    ) -> str:
+        """Generate comprehensive text evaluation prompt"""
+
+        model_section = ""
+        if model_solution:
+            model_section = f"""
+## MODEL SOLUTION:
+```
+{model_solution}
+```
+"""
+
+        return (
+            f"{self._comprehensive_prefix}{problem}\n{model_section}"
+            f"\n## STUDENT SUBMISSION:\n```\n{student_code}{self._comprehensive_suffix}"
+        )
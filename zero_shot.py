@@ -1,11 +1,3 @@
-from example import run_main_with_input
-from read_data import (
-    get_question_six_answers,
-    get_question_six_grades,
-    read_xlsx_to_dataframe,
-)
-
-
 seed = 12345
 
 question6 = """Jawab dalam bahasa Indonesia. Ini menggunakan bahasa notal ITB.
@@ -29,27 +21,63 @@ type ArrNamaMonst : < TNM : array [1..Nmax+1] of string,  
 Untuk soal-soal berikut, tuliskan secara lengkap: definisi/header, spesifikasi, dan body/realisasi fungsi. Tidak diperkenankan membuat dan menggunakan type/fungsi/prosedur baru. 
 Buatlah fungsi NilaiMaxKelas yang menerima input ArrNilai (misalnya T) dan kode kelas (misalnya KodeKls), kemudian mengembalikan nilai yang merupakan nilai tertinggi untuk kelas KodeKls. Jika array kosong atau jika KodeKls tidak ditemukan di array, dihasilkan nilai -1.
 """
-question6_answers = get_question_six_answers(
-    read_xlsx_to_dataframe("dataset/IF1210_01-Ujian Akhir Semester-responses.xlsx")
-)
-question6_grades = get_question_six_grades(
-    read_xlsx_to_dataframe("dataset/IF1210_01-Ujian Akhir Semester-grades.xlsx")
-)
-
-answer_sample = question6_answers.sample(n=5, random_state=seed)
-grade_sample = question6_grades.sample(n=5, random_state=seed)
-
-answer_sample = answer_sample.reset_index(drop=True)
-grade_sample = grade_sample.reset_index(drop=True)
-
-for index, students in answer_sample.iterrows():
-    print("=" * 3 + " Original grade: " + grade_sample.loc[index]["Q. 6 /4.00"])
-    print("=" * 3 + " NIM: " + str(grade_sample.loc[index]["First name"]))
-    print(answer_sample.loc[index]["Response 6"])
-    print("=" * 50)
-    # print(f"Original grade: {grade_sample.loc[index]['Q. 6 /4.00']}")
-    run_main_with_input(
-        problem=question6,
-        code=answer_sample.loc[index]["Response 6"],
-        student_id=str(answer_sample.loc[index]["First name"]),
+
+
+def main():
+    # Heavy imports (pandas, the HTTP stack) stay inside main so importing
+    # this module for the question text costs nothing
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from example import run_main_with_input
+    from grader import make_grader
+    from read_data import get_question_six_answers, get_question_six_grades
+
+    question6_answers = get_question_six_answers(
+        "dataset/IF1210_01-Ujian Akhir Semester-responses.xlsx"
     )
+    question6_grades = get_question_six_grades(
+        "dataset/IF1210_01-Ujian Akhir Semester-grades.xlsx"
+    )
+
+    answer_sample = question6_answers.sample(n=5, random_state=seed)
+    grade_sample = question6_grades.sample(n=5, random_state=seed)
+
+    answer_sample = answer_sample.reset_index(drop=True)
+    grade_sample = grade_sample.reset_index(drop=True)
+
+    # One grader for the whole run instead of a fresh client per student
+    grader = make_grader()
+
+    # Pull the columns out as plain arrays once instead of boxing a Series
+    # per row inside the loop
+    original_grades = grade_sample["Q. 6 /4.00"].to_numpy()
+    nims = grade_sample["First name"].to_numpy()
+    names = answer_sample["First name"].to_numpy()
+    responses = answer_sample["Response 6"].to_numpy()
+
+    def grade_student(index):
+        print("=" * 3 + " Original grade: " + original_grades[index])
+        print("=" * 3 + " NIM: " + str(nims[index]))
+        print(responses[index])
+        print("=" * 50)
+        # print(f"Original grade: {original_grades[index]}")
+        run_main_with_input(
+            problem=question6,
+            code=responses[index],
+            student_id=str(names[index]),
+            grader=grader,
+        )
+
+    # Each grading call spends its time waiting on the LLM API, so a thread
+    # pool runs the sample near-concurrently; output from different students
+    # may interleave
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        futures = [
+            executor.submit(grade_student, i) for i in range(len(responses))
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+
+if __name__ == "__main__":
+    main()